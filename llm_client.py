@@ -1,5 +1,27 @@
-from typing import Dict, List
-from openai import OpenAI
+import asyncio
+import functools
+import hashlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
 
 # NASA Expert System Prompt
 SYSTEM_PROMPT = """You are a NASA mission expert and historian with deep knowledge of space exploration,
@@ -20,66 +42,632 @@ When answering questions:
 You have access to mission transcripts, technical documents, and official NASA records.
 Always prioritize accuracy and cite your sources from the provided context."""
 
+# System message shared by every request (never mutated)
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
 
-def generate_response(openai_key: str, user_message: str, context: str,
-                     conversation_history: List[Dict], model: str = "gpt-3.5-turbo") -> str:
+# User message templates, filled with %-formatting
+_CONTEXT_TEMPLATE = """Based on the following NASA mission documents, please answer my question.
+
+%s
+
+Question: %s
+
+Please provide a detailed answer based on the context above. If the context doesn't contain relevant information, say so clearly."""
+
+_NO_CONTEXT_TEMPLATE = """Question: %s
+
+Note: No specific NASA documents were retrieved for this query. Please answer based on your general knowledge, but clearly indicate when you're not referencing specific mission documents."""
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Return the tiktoken encoding for a model, falling back to cl100k_base"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def estimate_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """
-    Generate response using OpenAI with context
+    Estimate the number of tokens in a text for a given model
 
     Args:
-        openai_key: OpenAI API key
-        user_message: The user's question
-        context: Retrieved context from NASA documents
-        conversation_history: Previous conversation messages
-        model: OpenAI model to use
+        text: Text to count
+        model: OpenAI model whose tokenizer should be used
 
     Returns:
-        Generated response string
+        Token count (approximated as 4 characters per token without tiktoken)
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return len(text) // 4 + 1
+    return len(_get_encoding(model).encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
     """
+    Cut a text to at most max_tokens tokens for a given model
+
+    Args:
+        text: Text to truncate
+        max_tokens: Maximum number of tokens to keep
+        model: OpenAI model whose tokenizer should be used
+
+    Returns:
+        Truncated text (approximated as 4 characters per token without tiktoken)
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return text[:max_tokens * 4]
+    encoding = _get_encoding(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+class RateLimiter:
+    """Token bucket that pre-accounts requests and tokens against per-minute limits"""
 
-    # Create OpenAI Client
-    client = OpenAI(api_key=openai_key)
+    def __init__(self, max_requests_per_minute: Optional[float] = None,
+                 max_tokens_per_minute: Optional[float] = None):
+        # A limit of None leaves that dimension unthrottled
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.available_request_capacity = max_requests_per_minute
+        self.available_token_capacity = max_tokens_per_minute
+        self.last_update_time = time.monotonic()
+        self._lock = threading.Lock()
 
-    # Build messages list starting with system prompt
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    def _try_consume(self, tokens: int) -> float:
+        """
+        Refill the buckets and consume capacity if enough is available
+
+        Returns:
+            0 if capacity was consumed, otherwise seconds to wait before retrying
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.last_update_time
+            self.last_update_time = now
+
+            # Refill both buckets proportionally to the elapsed time
+            request_wait = 0.0
+            if self.max_requests_per_minute:
+                self.available_request_capacity = min(
+                    self.max_requests_per_minute,
+                    self.available_request_capacity + self.max_requests_per_minute * elapsed / 60.0
+                )
+                if self.available_request_capacity < 1:
+                    request_wait = (1 - self.available_request_capacity) * 60.0 / self.max_requests_per_minute
+
+            token_wait = 0.0
+            if self.max_tokens_per_minute:
+                self.available_token_capacity = min(
+                    self.max_tokens_per_minute,
+                    self.available_token_capacity + self.max_tokens_per_minute * elapsed / 60.0
+                )
+                # A single request larger than the whole bucket can only wait for a full bucket
+                tokens = min(tokens, self.max_tokens_per_minute)
+                if self.available_token_capacity < tokens:
+                    token_wait = (tokens - self.available_token_capacity) * 60.0 / self.max_tokens_per_minute
+
+            if request_wait or token_wait:
+                return max(request_wait, token_wait, 0.01)
+
+            if self.max_requests_per_minute:
+                self.available_request_capacity -= 1
+            if self.max_tokens_per_minute:
+                self.available_token_capacity -= tokens
+            return 0.0
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait asynchronously until one request with the given token count may be sent"""
+        while True:
+            wait = self._try_consume(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: int) -> None:
+        """Block the calling thread until one request with the given token count may be sent"""
+        while True:
+            wait = self._try_consume(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class SemanticResponseCache:
+    """
+    Similarity cache of previous responses, keyed by question embedding
 
+    A cached response is reused when the question embeds within `threshold`
+    cosine similarity of a stored question that was answered with the same
+    model and the same retrieved context. Embeddings come from a local
+    all-MiniLM-L6-v2 model and are searched with a flat inner-product scan
+    over normalized vectors.
+
+    Entries are persisted append-only, one JSON line each with its embedding,
+    so a store writes a single line and an interrupted write can only leave a
+    truncated last line, which is skipped on load.
+    """
+
+    def __init__(self, cache_dir: str, threshold: float = 0.95,
+                 embedding_model: str = "all-MiniLM-L6-v2"):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ImportError("sentence-transformers is required for the semantic response cache")
+
+        self.cache_dir = Path(cache_dir)
+        self.cache_path = self.cache_dir / "entries.jsonl"
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self._model = None
+        self._lock = threading.Lock()
+
+        # Row i of the index matrix embeds the question of entries[i]; the matrix is
+        # rebuilt from the vectors lazily, so its width is whatever the model outputs
+        self._vectors: List[np.ndarray] = []
+        self._entries: List[Dict] = []
+        self._index: Optional[np.ndarray] = None
+        # Set when the file ends in a truncated line, so the next append starts a new one
+        self._needs_newline = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.cache_path.exists():
+            return
+
+        skipped = 0
+        with open(self.cache_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._needs_newline = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                    vector = np.asarray(entry.pop("embedding"), dtype=np.float32)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    skipped += 1
+                    continue
+                # Vectors from another embedding model are not comparable
+                if entry.get("embedding_model") != self.embedding_model or vector.ndim != 1:
+                    continue
+                if self._vectors and vector.shape != self._vectors[0].shape:
+                    skipped += 1
+                    continue
+                self._vectors.append(vector)
+                self._entries.append(entry)
+
+        if skipped:
+            print(f"Skipped {skipped} unreadable semantic cache entries in {self.cache_path}")
+
+    def _append(self, entry: Dict, vector: np.ndarray) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, 'a', encoding='utf-8') as f:
+            if self._needs_newline:
+                f.write("\n")
+                self._needs_newline = False
+            f.write(json.dumps({**entry, "embedding": vector.tolist()}) + "\n")
+
+    def _embed(self, text: str) -> np.ndarray:
+        if self._model is None:
+            self._model = SentenceTransformer(self.embedding_model)
+        return self._model.encode([text], convert_to_numpy=True,
+                                  normalize_embeddings=True).astype(np.float32)[0]
+
+    @staticmethod
+    def _context_hash(context: str) -> str:
+        return hashlib.sha1(context.encode("utf-8")).hexdigest()[:8]
+
+    def lookup(self, user_message: str, context: str, model: str) -> Optional[str]:
+        """Return a cached response for a sufficiently similar question, or None on a miss"""
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._index is None:
+                self._index = np.vstack(self._vectors)
+            query = self._embed(user_message)
+            context_hash = self._context_hash(context)
+            scores = self._index @ query
+
+            best_score, best_response = self.threshold, None
+            for i, entry in enumerate(self._entries):
+                if entry["model"] == model and entry["context_hash"] == context_hash and scores[i] > best_score:
+                    best_score, best_response = scores[i], entry["response"]
+            return best_response
+
+    def store(self, user_message: str, context: str, model: str, response: str) -> None:
+        """Add a response to the cache and append it to disk"""
+        with self._lock:
+            vector = self._embed(user_message)
+            entry = {
+                "question": user_message,
+                "context_hash": self._context_hash(context),
+                "model": model,
+                "embedding_model": self.embedding_model,
+                "response": response
+            }
+            self._append(entry, vector)
+            self._vectors.append(vector)
+            self._entries.append(entry)
+            self._index = None
+
+
+@functools.lru_cache(maxsize=4)
+def _get_client(api_key: str) -> OpenAI:
+    """Return a shared OpenAI client per API key so connections are pooled across calls"""
+    return OpenAI(api_key=api_key)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_async_client(api_key: str, loop: asyncio.AbstractEventLoop) -> AsyncOpenAI:
+    """Return a shared AsyncOpenAI client per API key and event loop (its connection pool is loop-bound)"""
+    return AsyncOpenAI(api_key=api_key)
+
+
+def compress_history(messages: List[Dict], keep_last_n: int = 6) -> List[Dict]:
+    """
+    Replace older assistant messages with one-line summaries to save prompt tokens
+
+    The last `keep_last_n` messages and all user messages are kept verbatim.
+    The input list is not modified.
+
+    Args:
+        messages: Conversation messages with 'role' and 'content' keys
+        keep_last_n: Number of most recent messages to keep at full fidelity
+
+    Returns:
+        New list of message dictionaries
+    """
+    cutoff = max(len(messages) - keep_last_n, 0)
+    compressed = []
+
+    for i, msg in enumerate(messages):
+        content = msg["content"]
+        if i < cutoff and msg["role"] == "assistant" and len(content) > 120:
+            # Keep the first sentence (capped at 80 chars) as the topic of the answer
+            first_sentence = re.match(r"\s*(.*?[.!?])(?:\s|$)", content, re.DOTALL)
+            topic = (first_sentence.group(1) if first_sentence else content).replace("\n", " ")[:80]
+            content = f"[earlier answer] {topic} [answered {len(content)} chars]"
+        compressed.append({"role": msg["role"], "content": content})
+
+    return compressed
+
+
+def build_messages(user_message: str, context: str, conversation_history: List[Dict]) -> List[Dict]:
+    """
+    Build the chat messages list sent to OpenAI
+
+    Args:
+        user_message: The user's question
+        context: Retrieved context from NASA documents
+        conversation_history: Previous conversation messages
+
+    Returns:
+        List of message dictionaries
+    """
     # Add conversation history (limit to last 10 exchanges to manage context length)
     history_limit = 20  # 10 exchanges = 20 messages (user + assistant)
     recent_history = conversation_history[-history_limit:] if len(conversation_history) > history_limit else conversation_history
 
-    for msg in recent_history:
-        messages.append({
-            "role": msg["role"],
-            "content": msg["content"]
-        })
+    # Summarize older answers; only the latest turns are sent in full
+    # (compress_history returns fresh role/content dicts, so they are used as-is)
+    recent_history = compress_history(recent_history)
 
     # Create the user message with context
     if context:
-        user_content = f"""Based on the following NASA mission documents, please answer my question.
+        user_content = _CONTEXT_TEMPLATE % (context, user_message)
+    else:
+        user_content = _NO_CONTEXT_TEMPLATE % user_message
 
-{context}
+    # Build messages list starting with the shared system prompt message
+    messages = [_SYSTEM_MSG, *recent_history, {"role": "user", "content": user_content}]
 
-Question: {user_message}
+    return messages
 
-Please provide a detailed answer based on the context above. If the context doesn't contain relevant information, say so clearly."""
-    else:
-        user_content = f"""Question: {user_message}
 
-Note: No specific NASA documents were retrieved for this query. Please answer based on your general knowledge, but clearly indicate when you're not referencing specific mission documents."""
+def generate_response(openai_key: str, user_message: str, context: str,
+                     conversation_history: List[Dict], model: str = "gpt-3.5-turbo",
+                     rate_limiter: Optional[RateLimiter] = None,
+                     response_cache: Optional[SemanticResponseCache] = None) -> str:
+    """
+    Generate response using OpenAI with context
 
-    messages.append({"role": "user", "content": user_content})
+    Args:
+        openai_key: OpenAI API key
+        user_message: The user's question
+        context: Retrieved context from NASA documents
+        conversation_history: Previous conversation messages
+        model: OpenAI model to use
+        rate_limiter: Optional limiter throttling requests to the account's RPM/TPM limits
+        response_cache: Optional semantic cache consulted before calling OpenAI
+            (only used without conversation history, which would change the answer)
+
+    Returns:
+        Generated response string
+    """
+
+    # Return a cached response for a near-identical question over the same context
+    use_cache = response_cache is not None and not conversation_history
+    if use_cache:
+        # A cache failure is a miss; it must never change the response
+        try:
+            cached = response_cache.lookup(user_message, context, model)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+    # Get the shared OpenAI Client
+    client = _get_client(openai_key)
+
+    # Build messages list (system prompt, recent history, user message with context)
+    messages = build_messages(user_message, context, conversation_history)
 
     # Send request to OpenAI
     try:
+        max_tokens = 1500
+        if rate_limiter:
+            rate_limiter.acquire_sync(
+                sum(estimate_tokens(m["content"], model) for m in messages) + max_tokens
+            )
+
         response = client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=0.7,
-            max_tokens=1500
+            max_tokens=max_tokens
         )
 
         # Return response
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
 
     except Exception as e:
         return f"Error generating response: {str(e)}"
+
+    if use_cache:
+        try:
+            response_cache.store(user_message, context, model, content)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+    return content
+
+
+async def generate_response_async(openai_key: str, user_message: str, context: str,
+                                  conversation_history: List[Dict], model: str = "gpt-3.5-turbo",
+                                  max_retries: int = 5,
+                                  rate_limiter: Optional[RateLimiter] = None,
+                                  response_cache: Optional[SemanticResponseCache] = None) -> str:
+    """
+    Generate response using AsyncOpenAI with context, retrying on rate limits
+
+    Args:
+        openai_key: OpenAI API key
+        user_message: The user's question
+        context: Retrieved context from NASA documents
+        conversation_history: Previous conversation messages
+        model: OpenAI model to use
+        max_retries: Maximum number of retries after a 429 response
+        rate_limiter: Optional limiter throttling requests to the account's RPM/TPM limits
+        response_cache: Optional semantic cache consulted before calling OpenAI
+            (only used without conversation history, which would change the answer)
+
+    Returns:
+        Generated response string
+    """
+
+    # Return a cached response for a near-identical question over the same context
+    use_cache = response_cache is not None and not conversation_history
+    if use_cache:
+        # A cache failure is a miss; it must never change the response
+        try:
+            cached = await asyncio.to_thread(response_cache.lookup, user_message, context, model)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+    # Get the shared AsyncOpenAI Client for the running event loop
+    client = _get_async_client(openai_key, asyncio.get_running_loop())
+
+    messages = build_messages(user_message, context, conversation_history)
+
+    # Pre-account prompt tokens plus the completion cap against the rate limits
+    max_tokens = 1500
+    estimated_tokens = sum(estimate_tokens(m["content"], model) for m in messages) + max_tokens
+
+    # Send request to OpenAI, backing off exponentially on rate limit errors
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        try:
+            if rate_limiter:
+                await rate_limiter.acquire(estimated_tokens)
+
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+
+            content = response.choices[0].message.content
+            break
+
+        except RateLimitError as e:
+            if attempt == max_retries:
+                return f"Error generating response: {str(e)}"
+            await asyncio.sleep(delay)
+            delay *= 2
+
+        except Exception as e:
+            return f"Error generating response: {str(e)}"
+
+    # Return response (a failed cache write only skips caching it)
+    if use_cache:
+        try:
+            await asyncio.to_thread(response_cache.store, user_message, context, model, content)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+    return content
+
+
+def build_packed_messages(user_messages: List[str], contexts: List[str]) -> List[Dict]:
+    """
+    Build one chat request answering several independent questions at once
+
+    Args:
+        user_messages: The questions
+        contexts: Retrieved context for each question (may be empty strings)
+
+    Returns:
+        List of message dictionaries asking for a JSON object {"answers": [...]}
+    """
+    sections = []
+    for i, (user_message, context) in enumerate(zip(user_messages, contexts)):
+        if context:
+            sections.append(f"### Q{i}\n\n{context}\n\nQuestion: {user_message}")
+        else:
+            sections.append(f"### Q{i}\n\n(No NASA documents were retrieved for this question.)\n\nQuestion: {user_message}")
+
+    user_content = (
+        f"Answer each of the {len(user_messages)} NASA questions below independently, "
+        "using the documents given with that question. Return a JSON object of the form "
+        '{"answers": ["answer to Q0", "answer to Q1", ...]} with exactly one answer string '
+        "per question, in order.\n\n" + "\n\n".join(sections)
+    )
+
+    return [_SYSTEM_MSG, {"role": "user", "content": user_content}]
+
+
+async def generate_responses_packed_async(openai_key: str, user_messages: List[str], contexts: List[str],
+                                          model: str = "gpt-3.5-turbo",
+                                          rate_limiter: Optional[RateLimiter] = None,
+                                          max_retries: int = 5) -> List[str]:
+    """
+    Generate responses for several questions with a single chat request, retrying on rate limits
+
+    Args:
+        openai_key: OpenAI API key
+        user_messages: The questions
+        contexts: Retrieved context for each question
+        model: OpenAI model to use (must support JSON mode)
+        rate_limiter: Optional limiter throttling requests to the account's RPM/TPM limits
+        max_retries: Maximum number of retries after a 429 response
+
+    Returns:
+        One response string per question
+
+    Raises:
+        ValueError: If the response is not JSON with one answer per question
+        RateLimitError: If the request is still rate limited after max_retries
+    """
+    client = _get_async_client(openai_key, asyncio.get_running_loop())
+    messages = build_packed_messages(user_messages, contexts)
+
+    # Room for every answer, within the model's completion cap
+    max_tokens = min(1500 * len(user_messages), 4096)
+    estimated_tokens = sum(estimate_tokens(m["content"], model) for m in messages) + max_tokens
+
+    # Back off exponentially on rate limit errors, as generate_response_async does
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        try:
+            if rate_limiter:
+                await rate_limiter.acquire(estimated_tokens)
+
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"}
+            )
+            break
+
+        except RateLimitError:
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    try:
+        payload = json.loads(response.choices[0].message.content)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Packed response is not valid JSON: {e}")
+    answers = payload.get("answers") if isinstance(payload, dict) else None
+    if not isinstance(answers, list) or len(answers) != len(user_messages):
+        raise ValueError(f"Expected {len(user_messages)} answers in packed response")
+    return [str(answer) for answer in answers]
+
+
+class PackedResponseGenerator:
+    """
+    Collects concurrent generate calls and answers them K questions per request
+
+    Callers await generate() as they would generate_response_async; requests are
+    queued and sent as one packed JSON-mode chat call once pack_size are waiting
+    or max_wait seconds have passed. If a packed call returns malformed JSON or
+    the wrong number of answers, its questions fall back to one request each;
+    other failures (including rate limits that outlast the retries) become an
+    error response for every question in the pack. Packing only fills up when
+    at least pack_size callers are in flight at once.
+    """
+
+    def __init__(self, openai_key: str, model: str = "gpt-3.5-turbo", pack_size: int = 5,
+                 rate_limiter: Optional[RateLimiter] = None, max_wait: float = 0.5):
+        self.openai_key = openai_key
+        self.model = model
+        self.pack_size = pack_size
+        self.rate_limiter = rate_limiter
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def generate(self, user_message: str, context: str) -> str:
+        """Queue one question and wait for its answer"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_message, context, future))
+
+        if len(self._pending) >= self.pack_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch) -> None:
+        user_messages = [user_message for user_message, _, _ in batch]
+        contexts = [context for _, context, _ in batch]
+
+        try:
+            answers = await generate_responses_packed_async(
+                self.openai_key, user_messages, contexts, self.model, self.rate_limiter
+            )
+        except ValueError:
+            # Fall back to one request per question (never on 429s, which would multiply requests)
+            answers = await asyncio.gather(*[
+                generate_response_async(self.openai_key, user_message, context, [], self.model,
+                                        rate_limiter=self.rate_limiter)
+                for user_message, context in zip(user_messages, contexts)
+            ])
+        except Exception as e:
+            answers = [f"Error generating response: {str(e)}"] * len(batch)
+
+        for (_, _, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
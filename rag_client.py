@@ -1,8 +1,84 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+
 import chromadb
 from chromadb.config import Settings
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple, Union
 from pathlib import Path
 
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Token budget shared by all documents in a formatted context, shrunk per document
+# so that larger retrievals are compressed harder: budget = MAX - PENALTY * num_docs
+CONTEXT_TOKEN_BUDGET = 6000
+CONTEXT_TOKEN_PENALTY_PER_DOC = 100
+
+
+def _probe_chroma_dir(chroma_dir: Path) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Open one ChromaDB directory and describe its collections
+
+    Args:
+        chroma_dir: Directory to probe
+
+    Returns:
+        List of (backend key, backend info) pairs
+    """
+    entries = []
+
+    # Wrap connection attempt in try-except block for error handling
+    try:
+        # Initialize database client with directory path and configuration settings
+        client = chromadb.PersistentClient(
+            path=str(chroma_dir),
+            settings=Settings(anonymized_telemetry=False)
+        )
+
+        # Retrieve list of available collections from the database
+        collections = client.list_collections()
+
+        # Loop through each collection found
+        for collection in collections:
+            # Create unique identifier key combining directory and collection names
+            key = f"{chroma_dir.name}_{collection.name}"
+
+            # Build information dictionary
+            # Get document count with fallback for unsupported operations
+            try:
+                doc_count = collection.count()
+            except Exception:
+                doc_count = "unknown"
+
+            entries.append((key, {
+                # Store directory path as string
+                "directory": str(chroma_dir),
+                # Store collection name
+                "collection_name": collection.name,
+                # Create user-friendly display name
+                "display_name": f"{collection.name} ({doc_count} docs) - {chroma_dir.name}",
+                # Store document count
+                "doc_count": doc_count
+            }))
+
+    # Handle connection or access errors gracefully
+    except Exception as e:
+        # Create fallback entry for inaccessible directories
+        key = f"{chroma_dir.name}_error"
+        entries.append((key, {
+            "directory": str(chroma_dir),
+            "collection_name": "unknown",
+            # Include error information in display name with truncation
+            "display_name": f"Error: {str(e)[:50]}... - {chroma_dir.name}",
+            "doc_count": 0
+        }))
+
+    return entries
+
 
 def discover_chroma_backends() -> Dict[str, Dict[str, str]]:
     """Discover available ChromaDB backends in the project directory"""
@@ -13,53 +89,14 @@ def discover_chroma_backends() -> Dict[str, Dict[str, str]]:
     chroma_dirs = [d for d in current_dir.iterdir()
                    if d.is_dir() and (d.name.startswith('chroma') or 'chroma' in d.name.lower())]
 
-    # Loop through each discovered directory
-    for chroma_dir in chroma_dirs:
-        # Wrap connection attempt in try-except block for error handling
-        try:
-            # Initialize database client with directory path and configuration settings
-            client = chromadb.PersistentClient(
-                path=str(chroma_dir),
-                settings=Settings(anonymized_telemetry=False)
-            )
-
-            # Retrieve list of available collections from the database
-            collections = client.list_collections()
-
-            # Loop through each collection found
-            for collection in collections:
-                # Create unique identifier key combining directory and collection names
-                key = f"{chroma_dir.name}_{collection.name}"
-
-                # Build information dictionary
-                # Get document count with fallback for unsupported operations
-                try:
-                    doc_count = collection.count()
-                except Exception:
-                    doc_count = "unknown"
-
-                backends[key] = {
-                    # Store directory path as string
-                    "directory": str(chroma_dir),
-                    # Store collection name
-                    "collection_name": collection.name,
-                    # Create user-friendly display name
-                    "display_name": f"{collection.name} ({doc_count} docs) - {chroma_dir.name}",
-                    # Store document count
-                    "doc_count": doc_count
-                }
+    if not chroma_dirs:
+        return backends
 
-        # Handle connection or access errors gracefully
-        except Exception as e:
-            # Create fallback entry for inaccessible directories
-            key = f"{chroma_dir.name}_error"
-            backends[key] = {
-                "directory": str(chroma_dir),
-                "collection_name": "unknown",
-                # Include error information in display name with truncation
-                "display_name": f"Error: {str(e)[:50]}... - {chroma_dir.name}",
-                "doc_count": 0
-            }
+    # Probe directories in parallel; each opens its own client and sqlite handles
+    with ThreadPoolExecutor(max_workers=min(8, len(chroma_dirs))) as executor:
+        for entries in executor.map(_probe_chroma_dir, chroma_dirs):
+            for key, info in entries:
+                backends[key] = info
 
     # Return complete backends dictionary with all discovered collections
     return backends
@@ -91,6 +128,55 @@ def initialize_rag_system(chroma_dir: str, collection_name: str) -> Tuple[any, b
         return None, False, str(e)
 
 
+def build_where_filter(mission_filter: Optional[str]) -> Optional[Dict]:
+    """
+    Build the ChromaDB where clause for a mission filter
+
+    Args:
+        mission_filter: Optional mission name (e.g., "apollo_11"); "all", "none" or empty disable filtering
+
+    Returns:
+        Filter dictionary, or None for no filtering
+    """
+    # Check if filter parameter exists and is not set to "all" or equivalent
+    if mission_filter and mission_filter.lower() not in ["all", "none", ""]:
+        # Create filter dictionary with appropriate field-value pairs
+        return {"mission": mission_filter.lower()}
+    return None
+
+
+async def initialize_rag_system_async(host: str, port: int, collection_name: str) -> Tuple[any, bool, str]:
+    """
+    Initialize the RAG system against a ChromaDB server (client/server mode)
+
+    Requires a running server, e.g. `chroma run --path ./chroma_db_openai --port 8000`.
+    The returned AsyncCollection is bound to the running event loop, so queries
+    overlap with other asyncio work (such as OpenAI calls) instead of blocking it.
+
+    Args:
+        host: ChromaDB server host
+        port: ChromaDB server port
+        collection_name: Name of the collection to use
+
+    Returns:
+        Tuple of (collection, success, error_message)
+    """
+    try:
+        # Create a ChromaDB AsyncHttpClient
+        client = await chromadb.AsyncHttpClient(
+            host=host,
+            port=port,
+            settings=Settings(anonymized_telemetry=False)
+        )
+
+        # Return the collection with the collection_name
+        collection = await client.get_collection(name=collection_name)
+        return collection, True, ""
+
+    except Exception as e:
+        return None, False, str(e)
+
+
 def retrieve_documents(collection, query: str, n_results: int = 3,
                       mission_filter: Optional[str] = None) -> Optional[Dict]:
     """
@@ -106,13 +192,8 @@ def retrieve_documents(collection, query: str, n_results: int = 3,
         Query results dictionary or None on error
     """
     try:
-        # Initialize filter variable to None (represents no filtering)
-        where_filter = None
-
-        # Check if filter parameter exists and is not set to "all" or equivalent
-        if mission_filter and mission_filter.lower() not in ["all", "none", ""]:
-            # Create filter dictionary with appropriate field-value pairs
-            where_filter = {"mission": mission_filter.lower()}
+        # Build the where clause (None for no filtering)
+        where_filter = build_where_filter(mission_filter)
 
         # Execute database query with the following parameters
         results = collection.query(
@@ -132,13 +213,153 @@ def retrieve_documents(collection, query: str, n_results: int = 3,
         return None
 
 
-def format_context(documents: List[str], metadatas: List[Dict]) -> str:
+async def retrieve_documents_async(collection, query: str, n_results: int = 3,
+                                   mission_filter: Optional[str] = None) -> Optional[Dict]:
+    """
+    Retrieve relevant documents from a ChromaDB server collection with optional filtering
+
+    Args:
+        collection: ChromaDB AsyncCollection object (see initialize_rag_system_async)
+        query: Search query string
+        n_results: Number of results to return
+        mission_filter: Optional mission name to filter by (e.g., "apollo_11", "apollo_13", "challenger")
+
+    Returns:
+        Query results dictionary or None on error
+    """
+    try:
+        return await collection.query(
+            query_texts=[query],
+            n_results=n_results,
+            where=build_where_filter(mission_filter)
+        )
+
+    except Exception as e:
+        print(f"Error retrieving documents: {e}")
+        return None
+
+
+def retrieve_documents_batch(collection, queries: List[str], n_results: Union[int, List[int]] = 3,
+                             mission_filters: Optional[List[Optional[str]]] = None,
+                             batch_size: int = 100) -> List[Optional[Dict]]:
+    """
+    Retrieve documents for many queries with as few ChromaDB calls as possible
+
+    Queries are grouped by (mission filter, n_results); each group is sent as
+    one multi-query request (split into batches of `batch_size`), so the query
+    embeddings, where clause and index traversal setup are shared. Identical
+    queries within a group are only retrieved once.
+
+    Args:
+        collection: ChromaDB collection object
+        queries: Search query strings
+        n_results: Number of results per query, or one value per query
+        mission_filters: Optional mission filter per query (same length as queries)
+        batch_size: Maximum number of queries per ChromaDB call
+
+    Returns:
+        List of query results dictionaries (each shaped like retrieve_documents'
+        result for a single query), None for empty queries or failed batches
+    """
+    if mission_filters is None:
+        mission_filters = [None] * len(queries)
+    if isinstance(n_results, int):
+        n_results = [n_results] * len(queries)
+
+    # Group query positions by (normalized mission filter, n_results), then by query text
+    groups: Dict[Tuple[Optional[str], int], Dict[str, List[int]]] = {}
+    for i, (query, mission_filter, k) in enumerate(zip(queries, mission_filters, n_results)):
+        # Empty queries are left with a None result
+        if not query:
+            continue
+        where_filter = build_where_filter(mission_filter)
+        mission = where_filter["mission"] if where_filter else None
+        groups.setdefault((mission, k), {}).setdefault(query, []).append(i)
+
+    results: List[Optional[Dict]] = [None] * len(queries)
+
+    for (mission, k), positions_by_query in groups.items():
+        where_filter = {"mission": mission} if mission else None
+        unique_queries = list(positions_by_query)
+
+        for start in range(0, len(unique_queries), batch_size):
+            batch = unique_queries[start:start + batch_size]
+            try:
+                batch_results = collection.query(
+                    query_texts=batch,
+                    n_results=k,
+                    where=where_filter
+                )
+            except Exception as e:
+                print(f"Error retrieving documents: {e}")
+                continue
+
+            # Split the per-query result lists back out to every position asking that query
+            for j, query in enumerate(batch):
+                query_result = {
+                    key: value[j:j + 1] if key != "included" and isinstance(value, list) else value
+                    for key, value in batch_results.items()
+                }
+                for i in positions_by_query[query]:
+                    results[i] = query_result
+
+    return results
+
+
+def _pack_by_tokens(docs: List[str], budget_tokens: int, encoding=None) -> List[str]:
+    """
+    Greedily fit documents into a shared token budget
+
+    Documents are kept whole while they fit; the first one that does not fit
+    is cut to the remaining budget and marked as truncated, and any after it
+    are dropped.
+
+    Args:
+        docs: Document texts in priority order
+        budget_tokens: Total tokens available for all documents
+        encoding: tiktoken encoding (approximates 4 characters per token if None)
+
+    Returns:
+        List of packed document texts (possibly shorter than docs)
+    """
+    packed = []
+    remaining = budget_tokens
+
+    for doc in docs:
+        if remaining <= 0:
+            break
+
+        if encoding is not None:
+            tokens = encoding.encode(doc)
+            if len(tokens) <= remaining:
+                packed.append(doc)
+                remaining -= len(tokens)
+            else:
+                packed.append(encoding.decode(tokens[:remaining]) + "...[truncated]")
+                remaining = 0
+        else:
+            approx_tokens = len(doc) // 4 + 1
+            if approx_tokens <= remaining:
+                packed.append(doc)
+                remaining -= approx_tokens
+            else:
+                packed.append(doc[:remaining * 4] + "...[truncated]")
+                remaining = 0
+
+    return packed
+
+
+def format_context(documents: List[str], metadatas: List[Dict],
+                   seen_content: Optional[Set[bytes]] = None) -> str:
     """
     Format retrieved documents into context for LLM
 
     Args:
         documents: List of document text chunks
         metadatas: List of metadata dictionaries for each document
+        seen_content: Optional set of document fingerprints shared across calls;
+            documents already in it are skipped, and those included in this
+            context (whole or truncated) are added
 
     Returns:
         Formatted context string
@@ -146,20 +367,37 @@ def format_context(documents: List[str], metadatas: List[Dict]) -> str:
     if not documents:
         return ""
 
-    # Initialize list with header text for context section
-    context_parts = ["=== RELEVANT NASA MISSION DOCUMENTS ===\n"]
+    # Initialize buffer with header text for context section
+    context = io.StringIO()
+    context.write("=== RELEVANT NASA MISSION DOCUMENTS ===\n")
 
-    # Track seen documents to avoid duplicates
-    seen_content = set()
+    # Track seen documents to avoid duplicates (within this call and, when given, across calls)
+    if seen_content is None:
+        seen_content = set()
+    batch_seen = set()
 
-    # Loop through paired documents and their metadata using enumeration
+    # Collect unique documents with their original positions and fingerprints
+    unique_docs = []
     for i, (doc, metadata) in enumerate(zip(documents, metadatas)):
         # Skip duplicate content
-        doc_hash = hash(doc[:200])  # Hash first 200 chars as signature
-        if doc_hash in seen_content:
+        doc_hash = blake2b(doc.encode('utf-8', 'ignore'), digest_size=16).digest()  # Full-content fingerprint
+        if doc_hash in seen_content or doc_hash in batch_seen:
             continue
-        seen_content.add(doc_hash)
+        batch_seen.add(doc_hash)
+        unique_docs.append((i, doc, metadata, doc_hash))
 
+    # Fit documents into a token budget that shrinks as more documents are retrieved,
+    # but never below a quarter of the full budget
+    budget = max(CONTEXT_TOKEN_BUDGET - CONTEXT_TOKEN_PENALTY_PER_DOC * len(unique_docs),
+                 CONTEXT_TOKEN_BUDGET // 4)
+    encoding = tiktoken.get_encoding("cl100k_base") if TIKTOKEN_AVAILABLE else None
+    packed_docs = _pack_by_tokens([doc for _, doc, _, _ in unique_docs], budget, encoding)
+
+    # Only documents actually shown count as seen; ones dropped by the budget may appear later
+    seen_content.update(doc_hash for _, _, _, doc_hash in unique_docs[:len(packed_docs)])
+
+    # Loop through paired documents and their metadata
+    for (i, _, metadata, _), doc in zip(unique_docs, packed_docs):
         # Extract mission information from metadata with fallback value
         mission = metadata.get('mission', 'Unknown Mission')
         # Clean up mission name formatting (replace underscores, capitalize)
@@ -173,21 +411,13 @@ def format_context(documents: List[str], metadatas: List[Dict]) -> str:
         # Clean up category name formatting (replace underscores, capitalize)
         category_formatted = category.replace('_', ' ').title()
 
-        # Create formatted source header with index number and extracted information
-        source_header = f"\n--- Source {i + 1}: {mission_formatted} | {category_formatted} | {source} ---\n"
-        # Add source header to context parts list
-        context_parts.append(source_header)
+        # Write formatted source header with index number and extracted information
+        context.write(f"\n\n--- Source {i + 1}: {mission_formatted} | {category_formatted} | {source} ---\n\n")
 
-        # Check document length and truncate if necessary (max 2000 chars per chunk)
-        max_length = 2000
-        if len(doc) > max_length:
-            truncated_doc = doc[:max_length] + "...[truncated]"
-            context_parts.append(truncated_doc)
-        else:
-            # Add full document content to context parts list
-            context_parts.append(doc)
+        # Write (possibly truncated) document content
+        context.write(doc)
 
-    context_parts.append("\n=== END OF DOCUMENTS ===")
+    context.write("\n\n=== END OF DOCUMENTS ===")
 
-    # Join all context parts with newlines and return formatted string
-    return "\n".join(context_parts)
+    # Return formatted string built in a single buffer
+    return context.getvalue()
@@ -1,5 +1,17 @@
+import asyncio
+import atexit
+import functools
+import hashlib
 import os
-from typing import Dict, List, Optional
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from llm_client import RateLimiter, estimate_tokens, truncate_to_tokens
 
 # RAGAS imports with error handling
 try:
@@ -20,17 +32,325 @@ except ImportError as e:
     RAGAS_AVAILABLE = False
     IMPORT_ERROR = str(e)
 
+# Corpus-level BLEU/ROUGE backends (installed alongside RAGAS)
+try:
+    import sacrebleu
+    from rouge_score import rouge_scorer
+    CORPUS_METRICS_AVAILABLE = True
+except ImportError:
+    CORPUS_METRICS_AVAILABLE = False
+
+# Local embedding model for the fast (LLM-free) relevancy signal
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+# Persistent embedding cache shared across evaluation runs
+EMBEDDING_CACHE_PATH = Path.home() / ".cache" / "nasa_rag" / "embeddings.db"
+
+_cache_lock = threading.Lock()
+_cache_conn: Optional[sqlite3.Connection] = None
+
+
+def _get_cache_connection() -> sqlite3.Connection:
+    """Open (once) the SQLite embedding cache and ensure its table exists"""
+    global _cache_conn
+    if _cache_conn is None:
+        EMBEDDING_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _cache_conn = sqlite3.connect(str(EMBEDDING_CACHE_PATH), check_same_thread=False)
+        _cache_conn.execute("CREATE TABLE IF NOT EXISTS emb(k TEXT PRIMARY KEY, v BLOB)")
+        _cache_conn.commit()
+    return _cache_conn
+
+
+def _embedding_key(model: str, text: str) -> str:
+    """Cache key for an embedding: SHA-256 of the model name and text"""
+    return hashlib.sha256((model + text).encode("utf-8")).hexdigest()
+
+
+def _cache_get(keys: List[str]) -> Dict[str, List[float]]:
+    """Look up cached embeddings, returning only the keys that were found"""
+    if not keys:
+        return {}
+    found = {}
+    with _cache_lock:
+        conn = _get_cache_connection()
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT k, v FROM emb WHERE k IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for k, v in rows:
+                found[k] = np.frombuffer(v, dtype=np.float32).tolist()
+    return found
+
+
+def _cache_put(items: Dict[str, List[float]]) -> None:
+    """Upsert embeddings into the cache"""
+    if not items:
+        return
+    with _cache_lock:
+        conn = _get_cache_connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO emb(k, v) VALUES (?, ?)",
+            [(k, np.asarray(vec, dtype=np.float32).tobytes()) for k, vec in items.items()]
+        )
+        conn.commit()
+
+
+if RAGAS_AVAILABLE:
+    class CachedOpenAIEmbeddings(OpenAIEmbeddings):
+        """OpenAIEmbeddings that only calls the API for texts missing from the persistent cache"""
+
+        def _split_cached(self, texts: List[str]):
+            keys = [_embedding_key(self.model, text) for text in texts]
+            cached = _cache_get(list(set(keys)))
+            # Unique texts that still need an API call
+            missing = list({key: text for key, text in zip(keys, texts) if key not in cached}.items())
+            return keys, cached, missing
+
+        def embed_documents(self, texts: List[str], chunk_size: Optional[int] = None) -> List[List[float]]:
+            keys, cached, missing = self._split_cached(texts)
+            if missing:
+                vectors = super().embed_documents([text for _, text in missing], chunk_size)
+                new = {key: vec for (key, _), vec in zip(missing, vectors)}
+                _cache_put(new)
+                cached.update(new)
+            return [cached[key] for key in keys]
+
+        async def aembed_documents(self, texts: List[str], chunk_size: Optional[int] = None) -> List[List[float]]:
+            keys, cached, missing = self._split_cached(texts)
+            if missing:
+                vectors = await super().aembed_documents([text for _, text in missing], chunk_size)
+                new = {key: vec for (key, _), vec in zip(missing, vectors)}
+                _cache_put(new)
+                cached.update(new)
+            return [cached[key] for key in keys]
+
+        def embed_query(self, text: str) -> List[float]:
+            return self.embed_documents([text])[0]
+
+        async def aembed_query(self, text: str) -> List[float]:
+            return (await self.aembed_documents([text]))[0]
+
+
+def _context_key(context: str) -> str:
+    """Content fingerprint used to deduplicate retrieved contexts"""
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+
+def dedupe_contexts(contexts: List[str]) -> List[str]:
+    """Drop repeated contexts while preserving retrieval order"""
+    return list({_context_key(ctx): ctx for ctx in contexts}.values())
+
+
+def _reference_text(contexts: List[str]) -> str:
+    """Join contexts into the BLEU/ROUGE reference, limited to 250 tokens"""
+    return truncate_to_tokens(" ".join(contexts), 250)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_reference_metrics():
+    """Build the reference-based (non-LLM) metrics once"""
+    return BleuScore(), RougeScore()
+
+
+# Metric bundles per thread: the evaluator LLM's async client is bound to the
+# event loop of the thread that first runs it
+_thread_bundles = threading.local()
+
+
+def _get_metric_bundle(api_key: str, llm_model: str = "gpt-3.5-turbo",
+                       emb_model: str = "text-embedding-3-small"):
+    """
+    Return the evaluator models and metric instances for this thread, API key and model pair
+
+    Returns:
+        Tuple of (evaluator_llm, evaluator_embeddings, response_relevancy,
+        faithfulness, bleu_score, rouge_score)
+    """
+    bundles = getattr(_thread_bundles, "bundles", None)
+    if bundles is None:
+        bundles = _thread_bundles.bundles = {}
+    key = (api_key, llm_model, emb_model)
+    if key not in bundles:
+        bundles[key] = _build_metric_bundle(api_key, llm_model, emb_model)
+    return bundles[key]
+
+
+def _build_metric_bundle(api_key: str, llm_model: str, emb_model: str):
+    """
+    Build the evaluator models and metric instances
+
+    Returns:
+        Tuple of (evaluator_llm, evaluator_embeddings, response_relevancy,
+        faithfulness, bleu_score, rouge_score)
+    """
+    # Create evaluator LLM
+    evaluator_llm = LangchainLLMWrapper(
+        ChatOpenAI(
+            model=llm_model,
+            api_key=api_key,
+            temperature=0
+        )
+    )
+
+    # Create evaluator_embeddings backed by the persistent embedding cache
+    evaluator_embeddings = LangchainEmbeddingsWrapper(
+        CachedOpenAIEmbeddings(
+            model=emb_model,
+            api_key=api_key
+        )
+    )
+
+    # Define an instance for each metric to evaluate
+    response_relevancy = ResponseRelevancy(llm=evaluator_llm, embeddings=evaluator_embeddings)
+    faithfulness = Faithfulness(llm=evaluator_llm)
+    bleu_score, rouge_score = _get_reference_metrics()
+
+    return evaluator_llm, evaluator_embeddings, response_relevancy, faithfulness, bleu_score, rouge_score
+
+
+@functools.lru_cache(maxsize=4096)
+def _reference_scores(answer: str, reference_text: str) -> Tuple[float, float]:
+    """
+    Compute BLEU and ROUGE for an answer against a reference, memoized on both texts
+
+    Returns:
+        Tuple of (bleu_score, rouge_score), 0.0 for a metric that fails
+    """
+    bleu_score, rouge_score = _get_reference_metrics()
+    sample_with_ref = SingleTurnSample(
+        response=answer,
+        reference=reference_text
+    )
+
+    # BLEU score
+    try:
+        bleu = bleu_score.single_turn_score(sample_with_ref)
+        bleu = float(bleu) if bleu is not None else 0.0
+    except Exception:
+        bleu = 0.0
+
+    # ROUGE score
+    try:
+        rouge = rouge_score.single_turn_score(sample_with_ref)
+        rouge = float(rouge) if rouge is not None else 0.0
+    except Exception:
+        rouge = 0.0
+
+    return bleu, rouge
+
+
+def _resolve_api_key(openai_api_key: Optional[str]) -> Optional[str]:
+    """Get API key from the argument, falling back to the environment"""
+    return openai_api_key or os.getenv("OPENAI_API_KEY") or os.getenv("CHROMA_OPENAI_API_KEY")
+
+
+def prefetch_embeddings(texts: List[str], openai_api_key: Optional[str] = None) -> int:
+    """
+    Embed many texts up front so later RAGAS metric calls hit the embedding cache
+
+    All texts missing from the cache are sent to the embeddings endpoint as
+    one list input (split only at the client's per-request chunk size) instead
+    of one request per text during scoring.
+
+    Args:
+        texts: Texts to embed (duplicates and empty strings are skipped)
+        openai_api_key: Optional OpenAI API key (uses env var if not provided)
+
+    Returns:
+        Number of unique texts embedded or found in the cache
+    """
+    if not RAGAS_AVAILABLE:
+        return 0
+
+    api_key = _resolve_api_key(openai_api_key)
+    if not api_key:
+        return 0
+
+    unique_texts = list(dict.fromkeys(text for text in texts if text))
+    if not unique_texts:
+        return 0
+
+    try:
+        evaluator_embeddings = _get_metric_bundle(api_key)[1]
+        evaluator_embeddings.embeddings.embed_documents(unique_texts)
+        return len(unique_texts)
+    except Exception as e:
+        print(f"Error prefetching embeddings: {e}")
+        return 0
+
+
+def _prepare_evaluation(question: str, answer: str, contexts: List[str], api_key: str):
+    """
+    Build the RAGAS sample and the LLM-backed metrics to score it with
+
+    Returns:
+        Tuple of (deduplicated contexts, sample, list of (metric name, metric,
+        LLM calls the metric makes per sample))
+    """
+    # Reuse the evaluator models and metric instances for this API key
+    _, _, response_relevancy, faithfulness, _, _ = _get_metric_bundle(api_key)
+
+    # Prepare the sample for evaluation
+    # Join contexts into a list if not already
+    if isinstance(contexts, str):
+        contexts = [contexts]
+
+    # Overlapping retrievals often return the same chunk more than once
+    contexts = dedupe_contexts(contexts)
+
+    # Create the evaluation sample
+    sample = SingleTurnSample(
+        user_input=question,
+        response=answer,
+        retrieved_contexts=contexts
+    )
+
+    # Evaluate each metric individually for better error handling
+    # (ResponseRelevancy generates one question per LLM call, `strictness` times;
+    # Faithfulness extracts statements, then verifies them: two LLM calls)
+    metrics_to_evaluate = [
+        ("response_relevancy", response_relevancy, response_relevancy.strictness),
+        ("faithfulness", faithfulness, 2),
+    ]
+
+    return contexts, sample, metrics_to_evaluate
+
+
+def _add_reference_metrics(results: Dict[str, float], answer: str, contexts: List[str]) -> None:
+    """Add BLEU and ROUGE to results, using the contexts as reference text"""
+    if not contexts:
+        return
+    try:
+        results["bleu_score"], results["rouge_score"] = _reference_scores(answer, _reference_text(contexts))
+    except Exception:
+        results["bleu_score"] = 0.0
+        results["rouge_score"] = 0.0
+
 
 def evaluate_response_quality(question: str, answer: str, contexts: List[str],
-                             openai_api_key: Optional[str] = None) -> Dict[str, float]:
+                             openai_api_key: Optional[str] = None,
+                             rate_limiter: Optional[RateLimiter] = None,
+                             include_reference_metrics: bool = True) -> Dict[str, float]:
     """
     Evaluate response quality using RAGAS metrics
 
+    Must not be called from a worker thread without an event loop (RAGAS runs
+    its async metrics on the thread's loop); use evaluate_response_quality_async
+    from asyncio code.
+
     Args:
         question: The user's question
         answer: The generated answer
         contexts: List of retrieved context strings
         openai_api_key: Optional OpenAI API key (uses env var if not provided)
+        rate_limiter: Optional limiter throttling evaluator LLM calls to the account's RPM/TPM limits
+        include_reference_metrics: Also compute BLEU/ROUGE (batch callers score these in one pass)
 
     Returns:
         Dictionary with metric names and scores
@@ -38,58 +358,25 @@ def evaluate_response_quality(question: str, answer: str, contexts: List[str],
     if not RAGAS_AVAILABLE:
         return {"error": f"RAGAS not available: {IMPORT_ERROR}"}
 
-    # Get API key from environment if not provided
-    api_key = openai_api_key or os.getenv("OPENAI_API_KEY") or os.getenv("CHROMA_OPENAI_API_KEY")
+    api_key = _resolve_api_key(openai_api_key)
     if not api_key:
         return {"error": "OpenAI API key not provided"}
 
     try:
-        # Create evaluator LLM with model gpt-3.5-turbo
-        evaluator_llm = LangchainLLMWrapper(
-            ChatOpenAI(
-                model="gpt-3.5-turbo",
-                api_key=api_key,
-                temperature=0
-            )
-        )
-
-        # Create evaluator_embeddings with model text-embedding-3-small
-        evaluator_embeddings = LangchainEmbeddingsWrapper(
-            OpenAIEmbeddings(
-                model="text-embedding-3-small",
-                api_key=api_key
-            )
-        )
-
-        # Define an instance for each metric to evaluate
-        response_relevancy = ResponseRelevancy(llm=evaluator_llm, embeddings=evaluator_embeddings)
-        faithfulness = Faithfulness(llm=evaluator_llm)
-        bleu_score = BleuScore()
-        rouge_score = RougeScore()
-
-        # Prepare the sample for evaluation
-        # Join contexts into a list if not already
-        if isinstance(contexts, str):
-            contexts = [contexts]
-
-        # Create the evaluation sample
-        sample = SingleTurnSample(
-            user_input=question,
-            response=answer,
-            retrieved_contexts=contexts
-        )
+        contexts, sample, metrics_to_evaluate = _prepare_evaluation(question, answer, contexts, api_key)
 
         # Dictionary to store results
         results = {}
 
-        # Evaluate each metric individually for better error handling
-        metrics_to_evaluate = [
-            ("response_relevancy", response_relevancy),
-            ("faithfulness", faithfulness),
-        ]
+        # Estimated tokens per evaluator LLM call: the sample plus room for the judge's output
+        if rate_limiter:
+            sample_tokens = estimate_tokens(" ".join([question, answer] + list(contexts)), "gpt-3.5-turbo") + 500
 
-        for metric_name, metric in metrics_to_evaluate:
+        for metric_name, metric, llm_calls in metrics_to_evaluate:
             try:
+                if rate_limiter:
+                    for _ in range(llm_calls):
+                        rate_limiter.acquire_sync(sample_tokens)
                 score = metric.single_turn_score(sample)
                 results[metric_name] = float(score) if score is not None else 0.0
             except Exception as e:
@@ -97,33 +384,8 @@ def evaluate_response_quality(question: str, answer: str, contexts: List[str],
                 results[f"{metric_name}_error"] = str(e)[:50]
 
         # BLEU and ROUGE need reference text - use context as reference
-        if contexts:
-            try:
-                # For BLEU/ROUGE, create sample with reference
-                reference_text = " ".join(contexts)[:1000]  # Limit reference length
-                sample_with_ref = SingleTurnSample(
-                    user_input=question,
-                    response=answer,
-                    reference=reference_text
-                )
-
-                # BLEU score
-                try:
-                    bleu = bleu_score.single_turn_score(sample_with_ref)
-                    results["bleu_score"] = float(bleu) if bleu is not None else 0.0
-                except Exception:
-                    results["bleu_score"] = 0.0
-
-                # ROUGE score
-                try:
-                    rouge = rouge_score.single_turn_score(sample_with_ref)
-                    results["rouge_score"] = float(rouge) if rouge is not None else 0.0
-                except Exception:
-                    results["rouge_score"] = 0.0
-
-            except Exception as e:
-                results["bleu_score"] = 0.0
-                results["rouge_score"] = 0.0
+        if include_reference_metrics:
+            _add_reference_metrics(results, answer, contexts)
 
         return results
 
@@ -131,6 +393,194 @@ def evaluate_response_quality(question: str, answer: str, contexts: List[str],
         return {"error": f"Evaluation failed: {str(e)}"}
 
 
+_evaluation_loops: List[asyncio.AbstractEventLoop] = []
+
+
+def _start_evaluation_loop() -> None:
+    """Give an evaluation worker thread its own persistent event loop for RAGAS"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    _evaluation_loops.append(loop)
+
+
+def _close_evaluation_loops() -> None:
+    """Close the worker threads' event loops (the pool's threads have exited by now)"""
+    for loop in _evaluation_loops:
+        loop.close()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_evaluation_executor() -> ThreadPoolExecutor:
+    """Return the shared pool of evaluation threads, each with its own event loop"""
+    atexit.register(_close_evaluation_loops)
+    # Threads are only started as evaluations are submitted; callers cap concurrency
+    return ThreadPoolExecutor(max_workers=32, thread_name_prefix="ragas-eval",
+                              initializer=_start_evaluation_loop)
+
+
+async def evaluate_response_quality_async(question: str, answer: str, contexts: List[str],
+                                         openai_api_key: Optional[str] = None,
+                                         rate_limiter: Optional[RateLimiter] = None,
+                                         include_reference_metrics: bool = True) -> Dict[str, float]:
+    """
+    Evaluate response quality using RAGAS metrics without blocking the event loop
+
+    Runs evaluate_response_quality on a pool thread that keeps its own event
+    loop and metric instances. RAGAS makes blocking calls inside its async
+    metrics (ResponseRelevancy embeds its generated questions synchronously),
+    so scoring on the caller's loop would stall every other in-flight task.
+
+    Args:
+        question: The user's question
+        answer: The generated answer
+        contexts: List of retrieved context strings
+        openai_api_key: Optional OpenAI API key (uses env var if not provided)
+        rate_limiter: Optional limiter throttling evaluator LLM calls to the account's RPM/TPM limits
+        include_reference_metrics: Also compute BLEU/ROUGE
+
+    Returns:
+        Dictionary with metric names and scores
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_evaluation_executor(),
+        functools.partial(evaluate_response_quality, question, answer, contexts,
+                          openai_api_key, rate_limiter, include_reference_metrics)
+    )
+
+
+def reference_scores(answer: str, contexts: List[str]) -> Dict[str, float]:
+    """
+    Compute only the reference-based metrics (BLEU, ROUGE) using contexts as reference
+
+    Scored with sacrebleu/rouge_score directly when installed, which needs no
+    event loop and so is safe to run in a worker thread.
+
+    Args:
+        answer: The generated answer
+        contexts: List of retrieved context strings
+
+    Returns:
+        Dictionary with bleu_score and rouge_score (empty without contexts)
+    """
+    if not (CORPUS_METRICS_AVAILABLE or RAGAS_AVAILABLE):
+        return {"error": f"RAGAS not available: {IMPORT_ERROR}"}
+
+    contexts = dedupe_contexts(contexts)
+    if not contexts:
+        return {}
+
+    (bleu, rouge), = batch_reference_scores([answer], [_reference_text(contexts)])[0]
+    return {"bleu_score": bleu, "rouge_score": rouge}
+
+
+@functools.lru_cache(maxsize=2)
+def _get_local_model(model_name: str):
+    """
+    Load a sentence-transformers model once, in FP16 on CUDA when a GPU is available
+
+    Returns:
+        Tuple of (model, on_gpu)
+    """
+    import torch
+
+    if torch.cuda.is_available():
+        model = SentenceTransformer(model_name, device="cuda")
+        model.half()
+        return model, True
+    return SentenceTransformer(model_name, device="cpu"), False
+
+
+def local_relevancy(questions: List[str], answers: List[str],
+                    model_name: str = "all-MiniLM-L6-v2") -> List[float]:
+    """
+    Score answer relevancy as the cosine similarity of question and answer embeddings
+
+    A lightweight stand-in for RAGAS ResponseRelevancy: no LLM call and no
+    OpenAI embedding call, all pairs are encoded locally in one batch. On a
+    GPU the model runs in FP16 and the scores are computed on-device; on CPU
+    it runs in FP32 with numpy.
+
+    Args:
+        questions: Questions
+        answers: Answers, aligned with questions
+        model_name: sentence-transformers model to embed with
+
+    Returns:
+        List of similarity scores, one per question/answer pair
+    """
+    if not SENTENCE_TRANSFORMERS_AVAILABLE:
+        raise ImportError("sentence-transformers is required for local relevancy scoring")
+    if not questions:
+        return []
+
+    model, on_gpu = _get_local_model(model_name)
+    texts = list(questions) + list(answers)
+
+    if on_gpu:
+        embeddings = model.encode(texts, batch_size=256, convert_to_tensor=True,
+                                  normalize_embeddings=True)
+        q_emb, a_emb = embeddings[:len(questions)], embeddings[len(questions):]
+        # Row-wise dot product on-device, accumulated in FP32
+        scores = (q_emb.float() * a_emb.float()).sum(dim=1).cpu().numpy()
+    else:
+        embeddings = model.encode(texts, batch_size=64, convert_to_numpy=True,
+                                  normalize_embeddings=True)
+        q_emb, a_emb = embeddings[:len(questions)], embeddings[len(questions):]
+        # Row-wise dot product of normalized vectors is the cosine similarity
+        scores = (q_emb * a_emb).sum(axis=1)
+
+    return [float(score) for score in scores]
+
+
+def batch_reference_scores(answers: List[str], references: List[str]) -> Tuple[List[Tuple[float, float]], Optional[float]]:
+    """
+    Compute BLEU and ROUGE-L for many answer/reference pairs in one pass
+
+    Computes each pair exactly as RAGAS BleuScore/RougeScore do (BLEU is
+    sacrebleu corpus_bleu over the texts split on ". ", ROUGE-L F-measure
+    with stemming) but with a single RougeScorer for the whole batch, and
+    also reports corpus-level BLEU over all pairs. Falls back to per-sample
+    RAGAS scoring when sacrebleu or rouge_score is not installed.
+
+    Args:
+        answers: Generated answers
+        references: Reference texts, aligned with answers
+
+    Returns:
+        Tuple of (list of (bleu_score, rouge_score) per pair, corpus BLEU or None)
+    """
+    if not answers or not (CORPUS_METRICS_AVAILABLE or RAGAS_AVAILABLE):
+        return [], None
+
+    if not CORPUS_METRICS_AVAILABLE:
+        return [_reference_scores(a, r) for a, r in zip(answers, references)], None
+
+    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=True)
+
+    scores = []
+    for answer, reference in zip(answers, references):
+        try:
+            # Same sentence split and corpus_bleu call as RAGAS BleuScore
+            bleu_value = sacrebleu.corpus_bleu(
+                answer.split(". "), [[sentence] for sentence in reference.split(". ")]
+            ).score / 100
+        except Exception:
+            bleu_value = 0.0
+        try:
+            rouge_value = scorer.score(reference, answer)["rougeL"].fmeasure
+        except Exception:
+            rouge_value = 0.0
+        scores.append((bleu_value, rouge_value))
+
+    try:
+        corpus_bleu = sacrebleu.corpus_bleu(list(answers), [list(references)]).score / 100
+    except Exception:
+        corpus_bleu = None
+
+    return scores, corpus_bleu
+
+
 def batch_evaluate(test_data: List[Dict], openai_api_key: Optional[str] = None) -> Dict[str, any]:
     """
     Evaluate a batch of test questions
@@ -158,10 +608,26 @@ def batch_evaluate(test_data: List[Dict], openai_api_key: Optional[str] = None)
         "rouge_score": []
     }
 
+    # Embed every question in one batched request before scoring (ResponseRelevancy
+    # only embeds the question and the questions it generates, never the answer)
+    prefetch_embeddings([item.get("question", "") for item in test_data], openai_api_key)
+
+    # Deduplicated contexts per item
+    item_contexts = [dedupe_contexts(item.get("contexts", [])) for item in test_data]
+
+    # Score BLEU/ROUGE for every item with contexts in one pass
+    reference_items = [i for i, item in enumerate(test_data)
+                       if item.get("question") and item.get("answer") and item_contexts[i]]
+    reference_results, corpus_bleu = batch_reference_scores(
+        [test_data[i]["answer"] for i in reference_items],
+        [_reference_text(item_contexts[i]) for i in reference_items]
+    )
+    reference_scores_by_item = dict(zip(reference_items, reference_results))
+
     for i, item in enumerate(test_data):
         question = item.get("question", "")
         answer = item.get("answer", "")
-        contexts = item.get("contexts", [])
+        contexts = item_contexts[i]
 
         if not question or not answer:
             results["individual_results"].append({
@@ -170,8 +636,11 @@ def batch_evaluate(test_data: List[Dict], openai_api_key: Optional[str] = None)
             })
             continue
 
-        # Evaluate this item
-        scores = evaluate_response_quality(question, answer, contexts, openai_api_key)
+        # Evaluate this item (reference metrics were already scored for the batch)
+        scores = evaluate_response_quality(question, answer, contexts, openai_api_key,
+                                           include_reference_metrics=False)
+        if i in reference_scores_by_item and "error" not in scores:
+            scores["bleu_score"], scores["rouge_score"] = reference_scores_by_item[i]
 
         # Store individual result
         result = {
@@ -196,6 +665,9 @@ def batch_evaluate(test_data: List[Dict], openai_api_key: Optional[str] = None)
                 "count": len(scores)
             }
 
+    if corpus_bleu is not None:
+        results["aggregate_metrics"]["corpus_bleu"] = corpus_bleu
+
     return results
 
 
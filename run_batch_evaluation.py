@@ -8,91 +8,88 @@ the responses.
 """
 
 import argparse
+import asyncio
 import json
 import os
-from typing import Dict, List
+from pathlib import Path
+from typing import Dict, List, Optional, TextIO
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 import rag_client
 import llm_client
 import ragas_evaluator
 
+# Metrics aggregated across the batch
+METRICS = ["response_relevancy", "faithfulness", "bleu_score", "rouge_score"]
 
-def run_batch_evaluation(
+# Number of answers buffered per local relevancy batch in fast-eval mode
+LOCAL_RELEVANCY_BATCH_SIZE = 64
+
+
+async def process_question(
+    index: int,
+    item: Dict,
+    total: int,
+    docs_result: Optional[Dict],
     openai_key: str,
-    chroma_dir: str,
-    collection_name: str,
-    test_file: str,
+    model: str,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: Optional[llm_client.RateLimiter] = None,
+    response_cache: Optional[llm_client.SemanticResponseCache] = None,
+    fast_eval: bool = False,
+    async_collection=None,
     n_results: int = 3,
-    model: str = "gpt-3.5-turbo"
+    packer: Optional[llm_client.PackedResponseGenerator] = None
 ) -> Dict:
     """
-    Run batch evaluation on test questions
+    Generate and evaluate a single test question from its pre-fetched documents
 
     Args:
+        index: Position of the question in the test set
+        item: Test question dictionary
+        total: Total number of test questions
+        docs_result: Pre-fetched retrieval results for this question
         openai_key: OpenAI API key
-        chroma_dir: ChromaDB directory
-        collection_name: Collection name
-        test_file: Path to test questions file
-        n_results: Number of documents to retrieve
         model: LLM model to use
+        semaphore: Semaphore bounding the number of in-flight questions
+        rate_limiter: Optional limiter shared by all OpenAI calls in the batch
+        response_cache: Optional semantic cache of previous responses
+        fast_eval: Only compute BLEU/ROUGE here; relevancy is scored locally afterwards
+        async_collection: Optional ChromaDB server collection to retrieve from when
+            documents were not pre-fetched
+        n_results: Number of documents to retrieve from async_collection
+        packer: Optional generator answering several questions per OpenAI request
 
     Returns:
-        Evaluation results dictionary
+        Result dictionary for this question
     """
-    # Load test questions
-    print(f"Loading test questions from {test_file}...")
-    test_questions = ragas_evaluator.load_test_questions(test_file)
-
-    if not test_questions:
-        return {"error": f"No test questions found in {test_file}"}
-
-    print(f"Loaded {len(test_questions)} test questions")
-
-    # Initialize RAG system
-    print(f"Initializing RAG system from {chroma_dir}/{collection_name}...")
-    collection, success, error = rag_client.initialize_rag_system(chroma_dir, collection_name)
-
-    if not success:
-        return {"error": f"Failed to initialize RAG system: {error}"}
-
-    print("RAG system initialized successfully")
-
-    # Process each question
-    results = {
-        "total_questions": len(test_questions),
-        "individual_results": [],
-        "aggregate_metrics": {}
-    }
-
-    metric_scores = {
-        "response_relevancy": [],
-        "faithfulness": [],
-        "bleu_score": [],
-        "rouge_score": []
-    }
-
-    for i, item in enumerate(test_questions):
-        question = item.get("question", "")
-        category = item.get("category", "unknown")
-        mission = item.get("mission", None)
+    question = item.get("question", "")
+    category = item.get("category", "unknown")
+    mission = item.get("mission", None)
 
-        print(f"\n[{i+1}/{len(test_questions)}] Processing: {question[:50]}...")
+    if not question:
+        return {
+            "index": index,
+            "error": "Empty question"
+        }
 
-        if not question:
-            results["individual_results"].append({
-                "index": i,
-                "error": "Empty question"
-            })
-            continue
+    async with semaphore:
+        print(f"\n[{index+1}/{total}] Processing: {question[:50]}...")
 
         try:
-            # Retrieve documents
-            docs_result = rag_client.retrieve_documents(
-                collection,
-                question,
-                n_results,
-                mission_filter=mission
-            )
+            # Retrieve documents from the ChromaDB server inside the event loop
+            if async_collection is not None:
+                docs_result = await rag_client.retrieve_documents_async(
+                    async_collection,
+                    question,
+                    item.get("n_results", n_results),
+                    mission_filter=mission
+                )
 
             # Format context
             context = ""
@@ -104,28 +101,36 @@ def run_batch_evaluation(
                 )
                 contexts_list = docs_result["documents"][0]
 
-            # Generate response
-            response = llm_client.generate_response(
-                openai_key,
-                question,
-                context,
-                [],  # No conversation history for batch
-                model
-            )
-
-            print(f"   Answer: {response[:100]}...")
+            # Generate response (packed with other questions when a packer is given)
+            if packer is not None:
+                response = await packer.generate(question, context)
+            else:
+                response = await llm_client.generate_response_async(
+                    openai_key,
+                    question,
+                    context,
+                    [],  # No conversation history for batch
+                    model,
+                    rate_limiter=rate_limiter,
+                    response_cache=response_cache
+                )
 
             # Evaluate response
-            scores = ragas_evaluator.evaluate_response_quality(
-                question,
-                response,
-                contexts_list,
-                openai_key
-            )
-
-            # Store result
-            result = {
-                "index": i,
+            if fast_eval:
+                # BLEU/ROUGE are CPU-bound; keep them off the event loop
+                scores = await asyncio.to_thread(ragas_evaluator.reference_scores, response, contexts_list)
+            else:
+                # Scored on an evaluation thread with its own event loop
+                scores = await ragas_evaluator.evaluate_response_quality_async(
+                    question,
+                    response,
+                    contexts_list,
+                    openai_key,
+                    rate_limiter
+                )
+
+            return {
+                "index": index,
                 "question": question,
                 "category": category,
                 "mission": mission,
@@ -133,43 +138,332 @@ def run_batch_evaluation(
                 "context_count": len(contexts_list),
                 "scores": scores
             }
-            results["individual_results"].append(result)
 
-            # Collect scores for aggregation
-            for metric in metric_scores.keys():
+        except Exception as e:
+            return {
+                "index": index,
+                "question": question,
+                "error": str(e)
+            }
+
+
+def update_running_stats(stats: Dict, value: float) -> None:
+    """Fold one score into running mean/min/max/count aggregates (Welford-style mean)"""
+    if not stats:
+        stats.update({"mean": value, "min": value, "max": value, "count": 1})
+        return
+    stats["count"] += 1
+    stats["mean"] += (value - stats["mean"]) / stats["count"]
+    stats["min"] = min(stats["min"], value)
+    stats["max"] = max(stats["max"], value)
+
+
+def _dumps(result: Dict) -> str:
+    """Serialize one result as a JSON line, using orjson when it is installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(result).decode("utf-8")
+    return json.dumps(result)
+
+
+async def process_all_questions(
+    test_questions: List[Dict],
+    retrievals: Optional[List[Optional[Dict]]],
+    openai_key: str,
+    model: str,
+    max_concurrent: int,
+    rate_limiter: Optional[llm_client.RateLimiter] = None,
+    response_cache: Optional[llm_client.SemanticResponseCache] = None,
+    fast_eval: bool = False,
+    results_file: Optional[TextIO] = None,
+    async_collection=None,
+    n_results: int = 3,
+    pack_size: int = 1
+) -> Dict:
+    """
+    Process all test questions concurrently, draining results as they complete
+
+    Args:
+        test_questions: List of test question dictionaries
+        retrievals: Pre-fetched retrieval results, one per test question (None to
+            retrieve per question from async_collection)
+        openai_key: OpenAI API key
+        model: LLM model to use
+        max_concurrent: Maximum number of questions in flight at once
+        rate_limiter: Optional limiter shared by all OpenAI calls in the batch
+        response_cache: Optional semantic cache of previous responses
+        fast_eval: Skip the LLM-based RAGAS metrics for each question
+        results_file: Optional open file; each result is appended to it as a
+            JSON line as soon as it completes instead of being kept in memory
+        async_collection: Optional ChromaDB server collection used when retrievals is None
+        n_results: Number of documents to retrieve from async_collection
+        pack_size: Number of questions answered per OpenAI request (1 disables packing)
+
+    Returns:
+        Dictionary with success/failure counts, running aggregate metrics and,
+        when no results_file is given, the individual results ordered by index
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+    total = len(test_questions)
+    packer = None
+    if pack_size > 1:
+        packer = llm_client.PackedResponseGenerator(openai_key, model, pack_size, rate_limiter)
+    tasks = [
+        asyncio.create_task(process_question(i, item, total,
+                                             retrievals[i] if retrievals is not None else None,
+                                             openai_key, model, semaphore, rate_limiter,
+                                             response_cache, fast_eval, async_collection,
+                                             n_results, packer))
+        for i, item in enumerate(test_questions)
+    ]
+
+    summary = {
+        "successful": 0,
+        "failed": 0,
+        "aggregate_metrics": {metric: {} for metric in METRICS}
+    }
+    individual_results = [] if results_file is None else None
+    pending = []
+
+    async def flush_pending():
+        # Fast mode: score relevancy for the buffered answers in one local embedding batch
+        if fast_eval:
+            scored = [r for r in pending if "error" not in r]
+            try:
+                relevancy = await asyncio.to_thread(
+                    ragas_evaluator.local_relevancy,
+                    [r["question"] for r in scored],
+                    [r["answer"] for r in scored]
+                )
+                for result, score in zip(scored, relevancy):
+                    result["scores"]["response_relevancy"] = score
+            except Exception as e:
+                # Still write and aggregate these results, just without relevancy
+                print(f"Local relevancy scoring failed: {e}")
+
+        for result in pending:
+            # Persist and aggregate each result, then let it go
+            if results_file is not None:
+                results_file.write(_dumps(result) + "\n")
+                results_file.flush()
+            else:
+                individual_results.append(result)
+
+            # Print progress as each question finishes
+            if "error" in result:
+                summary["failed"] += 1
+                print(f"   [{result['index']+1}/{total}] Error: {result['error']}")
+                continue
+
+            summary["successful"] += 1
+            scores = result["scores"]
+            for metric in METRICS:
                 if metric in scores and isinstance(scores[metric], (int, float)):
-                    metric_scores[metric].append(scores[metric])
+                    update_running_stats(summary["aggregate_metrics"][metric], scores[metric])
 
-            # Print scores
-            print(f"   Scores: ", end="")
+            print(f"   [{result['index']+1}/{total}] Answer: {result['answer'][:100]}...")
+            print(f"   [{result['index']+1}/{total}] Scores: ", end="")
             for metric, score in scores.items():
                 if isinstance(score, (int, float)):
                     print(f"{metric}={score:.3f} ", end="")
             print()
 
-        except Exception as e:
-            results["individual_results"].append({
-                "index": i,
-                "question": question,
-                "error": str(e)
-            })
-            print(f"   Error: {e}")
+        pending.clear()
+
+    for task in asyncio.as_completed(tasks):
+        pending.append(await task)
+        # Fast mode buffers a few results so relevancy is encoded in batches
+        if not fast_eval or len(pending) >= LOCAL_RELEVANCY_BATCH_SIZE:
+            await flush_pending()
+    await flush_pending()
+
+    summary["aggregate_metrics"] = {metric: stats for metric, stats in summary["aggregate_metrics"].items() if stats}
+    if individual_results is not None:
+        individual_results.sort(key=lambda r: r["index"])
+        summary["individual_results"] = individual_results
+    return summary
 
-    # Calculate aggregates
+
+async def process_all_questions_with_server(
+    chroma_host: str,
+    chroma_port: int,
+    collection_name: str,
+    test_questions: List[Dict],
+    n_results: int,
+    **kwargs
+) -> Dict:
+    """
+    Connect to a ChromaDB server and process all questions with async retrieval
+
+    The AsyncHttpClient must be created inside the running event loop, so the
+    connection and the question processing share this coroutine.
+
+    Args:
+        chroma_host: ChromaDB server host
+        chroma_port: ChromaDB server port
+        collection_name: Collection name
+        test_questions: List of test question dictionaries
+        n_results: Number of documents to retrieve
+        **kwargs: Remaining process_all_questions arguments
+
+    Returns:
+        process_all_questions summary, or a dictionary with an error
+    """
+    collection, success, error = await rag_client.initialize_rag_system_async(
+        chroma_host, chroma_port, collection_name
+    )
+
+    if not success:
+        return {"error": f"Failed to initialize RAG system: {error}"}
+
+    print("RAG system initialized successfully")
+
+    return await process_all_questions(
+        test_questions,
+        None,
+        async_collection=collection,
+        n_results=n_results,
+        **kwargs
+    )
+
+
+def run_batch_evaluation(
+    openai_key: str,
+    chroma_dir: str,
+    collection_name: str,
+    test_file: str,
+    n_results: int = 3,
+    model: str = "gpt-3.5-turbo",
+    max_concurrent: int = 10,
+    max_rpm: Optional[float] = None,
+    max_tpm: Optional[float] = None,
+    response_cache_dir: Optional[str] = None,
+    fast_eval: bool = False,
+    results_file: Optional[TextIO] = None,
+    chroma_host: Optional[str] = None,
+    chroma_port: int = 8000,
+    pack_size: int = 1
+) -> Dict:
+    """
+    Run batch evaluation on test questions
+
+    Args:
+        openai_key: OpenAI API key
+        chroma_dir: ChromaDB directory
+        collection_name: Collection name
+        test_file: Path to test questions file
+        n_results: Number of documents to retrieve (a test question's own "n_results" overrides it)
+        model: LLM model to use
+        max_concurrent: Maximum number of questions processed concurrently
+        max_rpm: Optional OpenAI requests-per-minute ceiling to throttle against
+        max_tpm: Optional OpenAI tokens-per-minute ceiling to throttle against
+        response_cache_dir: Optional directory for the semantic response cache
+        fast_eval: Replace RAGAS LLM metrics with local embedding relevancy plus BLEU/ROUGE
+        results_file: Optional open file to stream per-question results to as JSON lines
+            (individual results are then not kept in the returned dictionary)
+        chroma_host: Optional ChromaDB server host; when set, documents are retrieved
+            asynchronously from the server instead of from chroma_dir
+        chroma_port: ChromaDB server port
+        pack_size: Number of questions answered per OpenAI request (1 disables packing)
+
+    Returns:
+        Evaluation results dictionary
+    """
+    # Load test questions
+    print(f"Loading test questions from {test_file}...")
+    test_questions = ragas_evaluator.load_test_questions(test_file)
+
+    if not test_questions:
+        return {"error": f"No test questions found in {test_file}"}
+
+    print(f"Loaded {len(test_questions)} test questions")
+
+    # Initialize RAG system (server mode connects inside the event loop below)
+    if not chroma_host:
+        print(f"Initializing RAG system from {chroma_dir}/{collection_name}...")
+        collection, success, error = rag_client.initialize_rag_system(chroma_dir, collection_name)
+
+        if not success:
+            return {"error": f"Failed to initialize RAG system: {error}"}
+
+        print("RAG system initialized successfully")
+
+    # Embed all questions in one batched request so relevancy scoring hits the cache
+    # (fast mode scores relevancy locally and makes no OpenAI embedding calls)
+    if not fast_eval:
+        ragas_evaluator.prefetch_embeddings([item.get("question", "") for item in test_questions], openai_key)
+
+    # Throttle OpenAI calls proactively when account limits are given
+    rate_limiter = None
+    if max_rpm or max_tpm:
+        rate_limiter = llm_client.RateLimiter(
+            max_requests_per_minute=max_rpm,
+            max_tokens_per_minute=max_tpm
+        )
+
+    # Reuse responses to near-identical questions across runs when a cache directory is given
+    response_cache = None
+    if response_cache_dir:
+        try:
+            response_cache = llm_client.SemanticResponseCache(response_cache_dir)
+        except (ImportError, OSError) as e:
+            print(f"Semantic response cache disabled: {e}")
+
+    process_kwargs = dict(
+        openai_key=openai_key,
+        model=model,
+        max_concurrent=max_concurrent,
+        rate_limiter=rate_limiter,
+        response_cache=response_cache,
+        fast_eval=fast_eval,
+        results_file=results_file,
+        pack_size=pack_size
+    )
+
+    if chroma_host:
+        # Server mode: retrievals run in the same event loop as the OpenAI calls
+        print(f"Initializing RAG system from ChromaDB server {chroma_host}:{chroma_port}/{collection_name}...")
+        summary = asyncio.run(process_all_questions_with_server(
+            chroma_host,
+            chroma_port,
+            collection_name,
+            test_questions,
+            n_results,
+            **process_kwargs
+        ))
+
+        if "error" in summary:
+            return summary
+    else:
+        # Retrieve documents for all questions up front, grouped by (mission filter, n_results)
+        # so questions sharing a where clause share one ChromaDB query; the sample loop
+        # then only reads retrievals[i]
+        print("Retrieving documents for all questions...")
+        retrievals = rag_client.retrieve_documents_batch(
+            collection,
+            [item.get("question", "") for item in test_questions],
+            [item.get("n_results", n_results) for item in test_questions],
+            mission_filters=[item.get("mission", None) for item in test_questions]
+        )
+
+        # Process questions concurrently
+        summary = asyncio.run(process_all_questions(
+            test_questions,
+            retrievals,
+            **process_kwargs
+        ))
+
+    results = {
+        "total_questions": len(test_questions),
+        **summary
+    }
+
+    # Report aggregates computed while results were drained
     print("\n" + "=" * 60)
     print("AGGREGATE METRICS")
     print("=" * 60)
 
-    for metric, scores in metric_scores.items():
-        if scores:
-            agg = {
-                "mean": sum(scores) / len(scores),
-                "min": min(scores),
-                "max": max(scores),
-                "count": len(scores)
-            }
-            results["aggregate_metrics"][metric] = agg
-            print(f"{metric}: mean={agg['mean']:.3f}, min={agg['min']:.3f}, max={agg['max']:.3f} (n={agg['count']})")
+    for metric, agg in results["aggregate_metrics"].items():
+        print(f"{metric}: mean={agg['mean']:.3f}, min={agg['min']:.3f}, max={agg['max']:.3f} (n={agg['count']})")
 
     return results
 
@@ -178,11 +472,20 @@ def main():
     parser = argparse.ArgumentParser(description='Run batch evaluation on NASA RAG system')
     parser.add_argument('--openai-key', required=True, help='OpenAI API key')
     parser.add_argument('--chroma-dir', default='./chroma_db_openai', help='ChromaDB directory')
+    parser.add_argument('--chroma-host', default=None, help='ChromaDB server host; retrieves asynchronously from the server instead of --chroma-dir')
+    parser.add_argument('--chroma-port', type=int, default=8000, help='ChromaDB server port')
     parser.add_argument('--collection-name', default='nasa_space_missions_text', help='Collection name')
     parser.add_argument('--test-file', default='test_questions.json', help='Test questions file (JSON or TXT)')
     parser.add_argument('--n-results', type=int, default=3, help='Number of documents to retrieve')
     parser.add_argument('--model', default='gpt-3.5-turbo', help='LLM model to use')
-    parser.add_argument('--output', default='evaluation_results.json', help='Output file for results')
+    parser.add_argument('--output', default='evaluation_results.json', help='Output file for the run summary and aggregate metrics')
+    parser.add_argument('--results-jsonl', default=None, help='File per-question results are streamed to as JSON lines (default: --output with a .jsonl suffix)')
+    parser.add_argument('--max-concurrent', type=int, default=10, help='Maximum number of questions processed concurrently')
+    parser.add_argument('--max-rpm', type=float, default=None, help='OpenAI requests-per-minute limit to throttle against')
+    parser.add_argument('--max-tpm', type=float, default=None, help='OpenAI tokens-per-minute limit to throttle against')
+    parser.add_argument('--pack', type=int, default=1, help='Answer K questions per OpenAI request in JSON mode (default: 1, no packing)')
+    parser.add_argument('--fast-eval', action='store_true', help='Score relevancy with local embeddings instead of RAGAS LLM metrics')
+    parser.add_argument('--response-cache', default=None, help='Directory for the semantic response cache (disabled if not set)')
 
     args = parser.parse_args()
 
@@ -193,29 +496,43 @@ def main():
     print("NASA RAG BATCH EVALUATION")
     print("=" * 60)
 
-    # Run evaluation
-    results = run_batch_evaluation(
-        openai_key=args.openai_key,
-        chroma_dir=args.chroma_dir,
-        collection_name=args.collection_name,
-        test_file=args.test_file,
-        n_results=args.n_results,
-        model=args.model
-    )
-
-    # Save results
+    results_jsonl = args.results_jsonl or str(Path(args.output).with_suffix('.jsonl'))
+
+    # Run evaluation, streaming per-question results to disk as they complete
+    with open(results_jsonl, 'w') as results_file:
+        results = run_batch_evaluation(
+            openai_key=args.openai_key,
+            chroma_dir=args.chroma_dir,
+            collection_name=args.collection_name,
+            test_file=args.test_file,
+            n_results=args.n_results,
+            model=args.model,
+            max_concurrent=args.max_concurrent,
+            max_rpm=args.max_rpm,
+            max_tpm=args.max_tpm,
+            response_cache_dir=args.response_cache,
+            fast_eval=args.fast_eval,
+            results_file=results_file,
+            chroma_host=args.chroma_host,
+            chroma_port=args.chroma_port,
+            pack_size=args.pack
+        )
+
+    # Save summary
+    results["results_file"] = results_jsonl
     with open(args.output, 'w') as f:
         json.dump(results, f, indent=2)
 
-    print(f"\nResults saved to {args.output}")
+    print(f"\nPer-question results saved to {results_jsonl}")
+    print(f"Summary saved to {args.output}")
 
     # Summary
     print("\n" + "=" * 60)
     print("EVALUATION COMPLETE")
     print("=" * 60)
     print(f"Total questions: {results.get('total_questions', 0)}")
-    print(f"Successful evaluations: {len([r for r in results.get('individual_results', []) if 'error' not in r])}")
-    print(f"Failed evaluations: {len([r for r in results.get('individual_results', []) if 'error' in r])}")
+    print(f"Successful evaluations: {results.get('successful', 0)}")
+    print(f"Failed evaluations: {results.get('failed', 0)}")
 
 
 if __name__ == "__main__":